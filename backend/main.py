@@ -1,15 +1,44 @@
 import os
+import asyncio
+import base64
 import tempfile
+import textwrap
 from datetime import datetime
 import uuid
 import traceback
 import logging
-from fastapi import FastAPI, UploadFile, Form, File, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, UploadFile, Form, File, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from github import Github
 from dotenv import load_dotenv
 from services.ai_bug_fixer import AIBugFixer
+from services.function_utils import extract_primary_function_name, module_imports, extract_span, splice_span
+from services.symbol_index import extract_symbols
+from services.repo_tenancy import (
+    TenantRegistry,
+    RepoNotAllowedError,
+    RateLimitExceededError,
+    parse_repo_list,
+    parse_repo_map,
+    is_valid_branch_name,
+)
+from services.cancellation import CancellationToken, JobCancelledError, DeadlineExceededError
+from services.response_payload import (
+    FixedCodeStore,
+    compact_result,
+    requested_fields,
+    select_fields,
+    truncate_text,
+    is_git_sha,
+)
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # ✅ Load .env file at startup
 load_dotenv()
@@ -19,7 +48,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- FastAPI setup ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Stop the shared repo worker pool when the server shuts down
+    tenants.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,11 +65,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Brotli when available (falls back to gzip for clients without `br`), else plain gzip
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 # --- Environment variables ---
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_REPO = os.getenv("GITHUB_REPO", "indiraig/Auto-Hot-fix")
-GITHUB_BRANCH = os.getenv("GITHUB_BRANCH", "main")
+# Base branch for GITHUB_REPO; unset means the repository's default branch on GitHub
+GITHUB_BRANCH = os.getenv("GITHUB_BRANCH")
+# Used when the symbol index finds no file matching the bug report
+DEFAULT_TARGET_FILE = os.getenv("DEFAULT_TARGET_FILE", "utils.py")
+# Files without any function are sent whole only up to this size
+MAX_WHOLE_FILE_CHARS = int(os.getenv("MAX_WHOLE_FILE_CHARS", "8000"))
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Repositories requests may target; GITHUB_REPO is always allowed and is the default
+GITHUB_ALLOWED_REPOS = parse_repo_list(os.getenv("GITHUB_ALLOWED_REPOS")) or [GITHUB_REPO]
+# Optional per-repo credentials: "owner/name=token,owner/other=token"
+GITHUB_REPO_TOKENS = parse_repo_map(os.getenv("GITHUB_REPO_TOKENS"))
+# Optional per-repo base branches: "owner/name=branch"; others use their GitHub default branch
+GITHUB_REPO_BRANCHES = parse_repo_map(os.getenv("GITHUB_REPO_BRANCHES"))
+# Shared worker pool; while other repos are waiting each repo holds at most REPO_MAX_CONCURRENT_JOBS slots
+REPO_WORKERS = int(os.getenv("REPO_WORKERS", "8"))
+REPO_MAX_CONCURRENT_JOBS = int(os.getenv("REPO_MAX_CONCURRENT_JOBS", "1"))
+REPO_JOBS_PER_HOUR = int(os.getenv("REPO_JOBS_PER_HOUR", "60"))
+# Per-call bounds for GitHub API requests made by jobs
+GITHUB_TIMEOUT_SECONDS = int(os.getenv("GITHUB_TIMEOUT_SECONDS", "10"))
+GITHUB_RETRIES = int(os.getenv("GITHUB_RETRIES", "1"))
+# Overall budget for one bug report: LLM call, test run and GitHub writes together
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "120"))
+DISCONNECT_POLL_INTERVAL = 0.5
+# How long a job waits for a cold symbol index before using DEFAULT_TARGET_FILE
+INDEX_WAIT_SECONDS = float(os.getenv("INDEX_WAIT_SECONDS", "5"))
+# Size caps for test output in API responses and PR bodies
+MAX_TEST_OUTPUT_CHARS = int(os.getenv("MAX_TEST_OUTPUT_CHARS", "4000"))
+MAX_PR_TEST_OUTPUT_CHARS = int(os.getenv("MAX_PR_TEST_OUTPUT_CHARS", "2000"))
 
 if not GITHUB_TOKEN:
     raise RuntimeError("❌ GITHUB_TOKEN not found in environment variables")
@@ -42,12 +110,31 @@ if not GITHUB_REPO:
 if not OPENAI_API_KEY:
     raise RuntimeError("❌ OPENAI_API_KEY not found in environment variables")
 
-# --- GitHub client ---
-gh = Github(GITHUB_TOKEN)
+if GITHUB_REPO not in GITHUB_ALLOWED_REPOS:
+    GITHUB_ALLOWED_REPOS.append(GITHUB_REPO)
+if GITHUB_BRANCH:
+    GITHUB_REPO_BRANCHES.setdefault(GITHUB_REPO, GITHUB_BRANCH)
 
 # --- AI Bug Fixer ---
 ai_fixer = AIBugFixer()
 
+# --- Generated code, served by content hash instead of inline in every response ---
+fixed_code_store = FixedCodeStore(int(os.getenv("FIXED_CODE_CACHE_SIZE", "256")))
+
+# --- Per-repo GitHub clients, symbol indexes and budgets, scheduled fairly over one pool ---
+tenants = TenantRegistry(
+    GITHUB_TOKEN,
+    GITHUB_ALLOWED_REPOS,
+    default_repo=GITHUB_REPO,
+    repo_tokens=GITHUB_REPO_TOKENS,
+    repo_branches=GITHUB_REPO_BRANCHES,
+    workers=REPO_WORKERS,
+    max_concurrent_jobs=REPO_MAX_CONCURRENT_JOBS,
+    jobs_per_hour=REPO_JOBS_PER_HOUR,
+    github_timeout=GITHUB_TIMEOUT_SECONDS,
+    github_retries=GITHUB_RETRIES,
+)
+
 # --- FastAPI Root endpoint ---
 @app.get("/")
 async def root():
@@ -55,60 +142,273 @@ async def root():
 
 @app.post("/process-bug")
 async def process_bug(
+    request: Request,
     actual_bug: str = Form(...),
     expected_fix: str = Form(...),
-    bug_file: UploadFile = File(None)
+    bug_file: UploadFile = File(None),
+    repo: str = Form(None),
+    branch: str = Form(None),
+    deadline_seconds: float = Form(None),
+    fields: str = Query(None, description="Comma-separated fields to return, e.g. 'pr_url,ai_analysis.confidence'")
 ):
     """
     AI-Powered Bug Processing:
-    1. Read utils.py from GitHub repo
+    0. Resolve the target repo/branch (allow-listed) to its tenant
+    1. Locate the target file via the repo symbol index and read it
     2. Use AI to analyze the bug and generate a fix
     3. Run tests to verify the fix
     4. Create a new branch + commit
     5. Open a Pull Request
+
+    The whole job shares one deadline (JOB_DEADLINE_SECONDS, or the client's
+    shorter `deadline_seconds`) and is cancelled if the client disconnects.
+
+    The response is compact: fixed code is referenced by `fixed_code_hash`
+    (fetch it from /fixed-code/{hash}) and test output is truncated.
     """
     
-    logger.info(f"🐞 Received bug report | Bug: '{actual_bug}' | Expected: '{expected_fix}'")
+    logger.info(f"🐞 Received bug report | Repo: '{repo or GITHUB_REPO}' | Bug: '{actual_bug}' | Expected: '{expected_fix}'")
+
+    try:
+        tenant = tenants.resolve(repo)
+    except RepoNotAllowedError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    base_branch = branch or tenant.default_branch
+    if base_branch and not is_valid_branch_name(base_branch):
+        raise HTTPException(status_code=400, detail=f"Invalid branch name: '{base_branch}'")
+
+    # --- Handle optional uploaded file ---
+    file_saved_path = None
+    bug_filename = None
+    if bug_file:
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(await bug_file.read())
+            file_saved_path = tmp.name
+        bug_filename = bug_file.filename
+        logger.info(f"📂 Uploaded file temporarily saved at: {file_saved_path}")
+
+    timeout = JOB_DEADLINE_SECONDS
+    if deadline_seconds and deadline_seconds > 0:
+        timeout = min(timeout, deadline_seconds)
+    cancel_token = CancellationToken(timeout)
+    watcher = asyncio.create_task(_watch_disconnect(request, cancel_token))
 
+    # Blocking GitHub/LLM/test work runs on the repo's worker slot, not the event loop
     try:
+        result = await tenants.run(
+            tenant, _run_fix_pipeline,
+            tenant, base_branch, actual_bug, expected_fix, file_saved_path, bug_filename, cancel_token,
+            cancel_token=cancel_token
+        )
+    except RateLimitExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=f"Bug processing timed out after {timeout:.0f}s: {e}")
+    except JobCancelledError as e:
+        # Client closed the request; 499 mirrors the nginx convention
+        raise HTTPException(status_code=499, detail=str(e))
+    finally:
+        watcher.cancel()
+        cancel_token.close()
+
+    # Fixed code is only inlined when the client explicitly asks for it
+    keep_fixed_code = "ai_analysis.fixed_code" in requested_fields(fields)
+    payload = compact_result(
+        result, fixed_code_store, MAX_TEST_OUTPUT_CHARS,
+        repo_name=tenant.full_name, keep_fixed_code=keep_fixed_code
+    )
+    return select_fields(payload, fields)
+
+
+@app.get("/fixed-code/{code_hash}", response_class=PlainTextResponse)
+async def get_fixed_code(code_hash: str, repo: str = Query(None)):
+    """
+    Return AI-generated code referenced by `fixed_code_hash` in /process-bug
+    responses. The hash is the git blob SHA, so code that is no longer cached
+    here (restart, eviction, another worker) is read back from the committed
+    fix branch on GitHub.
+    """
+    code_hash = code_hash.lower()
+    if not is_git_sha(code_hash):
+        raise HTTPException(status_code=400, detail=f"Invalid fixed code hash: '{code_hash}'")
+
+    code = fixed_code_store.get(code_hash)
+    if code is None:
+        try:
+            tenant = tenants.resolve(repo)
+        except RepoNotAllowedError as e:
+            raise HTTPException(status_code=403, detail=str(e))
+        try:
+            loop = asyncio.get_running_loop()
+            blob = await loop.run_in_executor(None, tenant.get_repo().get_git_blob, code_hash)
+            code = base64.b64decode(blob.content).decode("utf-8")
+        except Exception as e:
+            logger.warning(f"⚠️ Fixed code {code_hash} not cached and not found in {tenant.full_name}: {str(e)}")
+            raise HTTPException(
+                status_code=404,
+                detail=f"No fixed code with hash '{code_hash}' (it was never committed to '{tenant.full_name}' and is no longer cached)"
+            )
+        fixed_code_store.put(code)
+    # Content-addressed, so clients and proxies can cache it forever
+    return PlainTextResponse(
+        code,
+        headers={"ETag": f'"{code_hash}"', "Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+def _find_target_span(content, path, target_symbol=None):
+    """
+    Locate the function to fix in `content` and return its symbol, or None.
+
+    `target_symbol` is the index match; it is looked up by qualname (so
+    `B.run` never resolves to `A.run`), preferring the definition closest to
+    its indexed start line, and only then by bare name.
+    """
+    functions = [sym for sym in extract_symbols(content, path) if sym["kind"] == "function"]
+    if not functions:
+        return None
+    if target_symbol:
+        for key in ("qualname", "name"):
+            candidates = [sym for sym in functions if sym[key] == target_symbol[key]]
+            if candidates:
+                return min(candidates, key=lambda sym: abs(sym["start_line"] - target_symbol["start_line"]))
+    name = extract_primary_function_name(content)
+    for sym in functions:
+        if sym["name"] == name:
+            return sym
+    top_level = [sym for sym in functions if "." not in sym["qualname"]] or functions
+    return top_level[0]
+
+
+def _target_definition_from_reply(reply, path, span):
+    """
+    Pull the fixed target definition out of the model's reply.
+
+    Returns (definition, None), or (None, reason) when the reply has no
+    unambiguous definition of the target. A reply that is a whole file only
+    contributes that definition, so nothing else gets duplicated into the file.
+    """
+    reply = textwrap.dedent(reply)
+    try:
+        compile(reply, path, "exec")
+    except SyntaxError as e:
+        return None, f"reply does not parse ({e.msg} at line {e.lineno})"
+    symbols = extract_symbols(reply, path)
+    functions = [sym for sym in symbols if sym["kind"] == "function"]
+    candidates = [sym for sym in functions if sym["qualname"] == span["qualname"]]
+    if not candidates:
+        candidates = [sym for sym in functions if sym["qualname"] == span["name"]]
+    if len(candidates) != 1:
+        found = "no" if not candidates else "several"
+        return None, f"reply has {found} top-level definitions of '{span['name']}'"
+    if len([sym for sym in symbols if "." not in sym["qualname"]]) > 1:
+        logger.warning(f"⚠️ AI reply for '{span['qualname']}' contains other definitions; only '{span['name']}' is applied")
+    return extract_span(reply, candidates[0]["start_line"], candidates[0]["end_line"]), None
+
+
+def _validate_fixed_file(fixed_content, path, function_name):
+    """Return why the fixed file must not be committed, or None if it looks complete"""
+    try:
+        compile(fixed_content, path, "exec")
+    except SyntaxError as e:
+        return f"fixed file does not parse ({e.msg} at line {e.lineno})"
+    if function_name and not any(sym["name"] == function_name for sym in extract_symbols(fixed_content, path)):
+        return f"'{function_name}' is missing from the fixed file"
+    return None
+
+
+async def _watch_disconnect(request: Request, cancel_token: CancellationToken):
+    """Cancel the job as soon as the client goes away"""
+    while not cancel_token.cancelled:
+        if await request.is_disconnected():
+            cancel_token.cancel("client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def _run_fix_pipeline(tenant, base_branch, actual_bug, expected_fix, file_saved_path, bug_filename, cancel_token):
+    """Fix pipeline for one bug report, executed on a worker slot of the tenant"""
+    fix_branch_name = None
+    try:
+        cancel_token.check()
         # Log the repository name for debugging
-        logger.info(f"🔎 Trying to access GitHub repo: {GITHUB_REPO}")
-        repo = gh.get_repo(GITHUB_REPO)
+        logger.info(f"🔎 Trying to access GitHub repo: {tenant.full_name}")
+        repo = tenant.get_repo()
         logger.info(f"✅ Connected to repo: {repo.full_name}")
-
-        # --- Handle optional uploaded file ---
-        file_saved_path = None
-        if bug_file:
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                tmp.write(await bug_file.read())
-                file_saved_path = tmp.name
-            logger.info(f"📂 Uploaded file temporarily saved at: {file_saved_path}")
+        base_branch = base_branch or tenant.get_default_branch()
+        cancel_token.check()
 
         # --- Get branch reference ---
         try:
-            branch = repo.get_branch(GITHUB_BRANCH)
+            branch = repo.get_branch(base_branch)
             logger.info(f"✅ Fetched branch '{branch.name}' | commit SHA: {branch.commit.sha}")
         except Exception as e:
-            logger.error(f"❌ Error fetching branch '{GITHUB_BRANCH}': {str(e)}")
-            raise HTTPException(status_code=404, detail=f"Branch '{GITHUB_BRANCH}' not found: {e}")
+            logger.error(f"❌ Error fetching branch '{base_branch}': {str(e)}")
+            raise HTTPException(status_code=404, detail=f"Branch '{base_branch}' not found: {e}")
 
-        # --- Read utils.py ---
+        # --- Locate the target file ---
+        cancel_token.check()
+        target_path = DEFAULT_TARGET_FILE
+        target_symbol = None
         try:
-            utils_file = repo.get_contents("utils.py", ref=GITHUB_BRANCH)
-            utils_content = utils_file.decoded_content.decode("utf-8")
-            logger.info(f"✅ Fetched 'utils.py' content")
+            tree_sha = branch.commit.commit.tree.sha
+            index = tenant.symbol_index.lookup(repo, tree_sha, wait=INDEX_WAIT_SECONDS, cancel_token=cancel_token)
+            matches = tenant.symbol_index.find_target_files(tree_sha, f"{actual_bug} {expected_fix}") if index is not None else []
+            if index is None:
+                logger.info(f"🎯 Symbol index for {tree_sha[:7]} is still building, falling back to '{target_path}'")
+            elif matches:
+                target_path = matches[0]["path"]
+                functions = [sym for sym in matches[0]["symbols"] if sym["kind"] == "function"]
+                target_symbol = functions[0] if functions else None
+                logger.info(f"🎯 Symbol index matched '{target_symbol['qualname'] if target_symbol else None}' in '{target_path}' (score {matches[0]['score']:.1f})")
+            else:
+                logger.info(f"🎯 No confident symbol match, falling back to '{target_path}'")
+        except JobCancelledError:
+            raise
         except Exception as e:
-            logger.error(f"❌ Error fetching 'utils.py': {str(e)}")
-            raise HTTPException(status_code=404, detail=f"utils.py not found in branch '{GITHUB_BRANCH}': {e}")
+            logger.warning(f"⚠️ Symbol index unavailable, falling back to '{target_path}': {str(e)}")
+
+        # --- Read target file ---
+        try:
+            target_file = repo.get_contents(target_path, ref=base_branch)
+            target_content = target_file.decoded_content.decode("utf-8")
+            logger.info(f"✅ Fetched '{target_path}' content")
+        except Exception as e:
+            logger.error(f"❌ Error fetching '{target_path}': {str(e)}")
+            raise HTTPException(status_code=404, detail=f"{target_path} not found in branch '{base_branch}': {e}")
+        cancel_token.check()
+
+        # --- Narrow to the target definition ---
+        # Only that definition goes to the model; its fix is spliced back into the file
+        target_function = None
+        span = _find_target_span(target_content, target_path, target_symbol)
+        if span:
+            target_function, start_line, end_line = span["name"], span["start_line"], span["end_line"]
+            code_for_ai = extract_span(target_content, start_line, end_line)
+            context = module_imports(target_content)
+            logger.info(f"✂️ Sending '{span['qualname']}' (lines {start_line}-{end_line}) of '{target_path}' to the model")
+        elif len(target_content) <= MAX_WHOLE_FILE_CHARS:
+            code_for_ai, context = target_content, None
+        else:
+            return {
+                "message": f"❌ No function to fix found in '{target_path}' and the file is too large to send whole",
+                "branch": base_branch,
+                "pr_url": None,
+                "file_saved": file_saved_path,
+                "target_file": target_path,
+            }
 
         # --- AI Analysis and Fix Generation ---
         logger.info("🤖 Starting AI analysis...")
-        ai_result = ai_fixer.analyze_and_fix_bug(actual_bug, expected_fix, utils_content)
+        ai_result = ai_fixer.analyze_and_fix_bug(
+            actual_bug, expected_fix, code_for_ai, target_path, target_function, cancel_token, context=context
+        )
         
         if not ai_result["success"]:
             return {
                 "message": f"❌ AI analysis failed: {ai_result.get('error', 'Unknown error')}",
-                "branch": GITHUB_BRANCH,
+                "branch": base_branch,
                 "pr_url": None,
                 "file_saved": file_saved_path,
                 "ai_analysis": ai_result
@@ -118,18 +418,41 @@ async def process_bug(
         if not fixed_code or fixed_code.strip() == "":
             return {
                 "message": "❌ AI could not generate a fix for this bug",
-                "branch": GITHUB_BRANCH,
+                "branch": base_branch,
+                "pr_url": None,
+                "file_saved": file_saved_path,
+                "ai_analysis": ai_result
+            }
+
+        # --- Splice the fix back into the file ---
+        splice_error = None
+        if span:
+            definition, splice_error = _target_definition_from_reply(fixed_code, target_path, span)
+            if definition is not None:
+                fixed_code = splice_span(target_content, start_line, end_line, definition)
+            ai_result["target_symbol"] = {
+                "name": target_function, "qualname": span["qualname"], "start_line": start_line, "end_line": end_line
+            }
+        splice_error = splice_error or _validate_fixed_file(fixed_code, target_path, target_function if span else None)
+        if splice_error:
+            logger.warning(f"⚠️ Rejected AI fix for '{target_path}': {splice_error}")
+            return {
+                "message": f"❌ AI returned an incomplete fix: {splice_error}. PR not created.",
+                "branch": None,
                 "pr_url": None,
                 "file_saved": file_saved_path,
+                "target_file": target_path,
                 "ai_analysis": ai_result
             }
+        ai_result["fixed_code"] = fixed_code
 
         # --- Run Tests ---
         logger.info("🧪 Running tests on the fixed code...")
         test_result = ai_fixer.run_tests(
     fixed_code,
     ai_result.get("test_cases", []),
-    ai_result.get("function_name")  # default fallback
+    ai_result.get("function_name"),  # default fallback
+    cancel_token
 )
         
         if not test_result["success"]:
@@ -145,9 +468,11 @@ async def process_bug(
             }
 
         # --- Create new branch ---
-        fix_branch_name = f"ai-fix-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        cancel_token.check()
+        new_branch_name = f"ai-fix-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
         try:
-            repo.create_git_ref(ref=f"refs/heads/{fix_branch_name}", sha=branch.commit.sha)
+            repo.create_git_ref(ref=f"refs/heads/{new_branch_name}", sha=branch.commit.sha)
+            fix_branch_name = new_branch_name
             logger.info(f"🌿 Created branch: {fix_branch_name}")
         except Exception as e:
             logger.error(f"❌ Failed to create branch: {str(e)}")
@@ -166,26 +491,28 @@ async def process_bug(
             }
 
         # --- Commit the AI-generated fix ---
+        cancel_token.check()
         commit_message = f"AI Fix: {ai_result.get('explanation', 'Bug fix generated by AI')}"
         repo.update_file(
-            utils_file.path,
+            target_file.path,
             commit_message,
             fixed_code,
-            utils_file.sha,
+            target_file.sha,
             branch=fix_branch_name,
         )
         logger.info(f"💾 Committed AI fix to {fix_branch_name}")
 
         # --- Optionally commit uploaded file ---
-        if file_saved_path and bug_file:
+        if file_saved_path and bug_filename:
+            cancel_token.check()
             with open(file_saved_path, "rb") as f:
                 repo.create_file(
-                    f"bug_reports/{bug_file.filename}",
+                    f"bug_reports/{bug_filename}",
                     f"Bug report for: {actual_bug}",
                     f.read(),
                     branch=fix_branch_name,
                 )
-            logger.info(f"📎 Uploaded bug file committed to bug_reports/{bug_file.filename}")
+            logger.info(f"📎 Uploaded bug file committed to bug_reports/{bug_filename}")
 
         # --- Create Pull Request ---
         pr_title = f"AI Fix: {actual_bug}"
@@ -202,7 +529,10 @@ async def process_bug(
 
 ### Test Results:
 - Tests Passed: {'✅ Yes' if test_result['success'] else '❌ No'}
-- Test Output: {test_result.get('output', 'No output')}
+- Test Output:
+```
+{truncate_text(test_result.get('output') or 'No output', MAX_PR_TEST_OUTPUT_CHARS)}
+```
 
 ### Confidence Level:
 {ai_result.get('confidence', 'Unknown')}
@@ -211,23 +541,37 @@ async def process_bug(
 *This PR was automatically generated by the AI Bug Fixer system.*
 """
         
+        cancel_token.check()
         pr = repo.create_pull(
             title=pr_title,
             body=pr_body,
             head=fix_branch_name,
-            base=GITHUB_BRANCH,
+            base=base_branch,
         )
         logger.info(f"🔀 Pull Request created: {pr.html_url}")
 
         return {
             "message": "✅ AI-powered bug fix completed and PR created successfully",
+            "repo": repo.full_name,
             "branch": fix_branch_name,
             "pr_url": pr.html_url,
             "file_saved": file_saved_path,
+            "target_file": target_path,
             "ai_analysis": ai_result,
             "test_results": test_result
         }
 
+    except JobCancelledError:
+        # Don't leave a half-finished fix branch behind once the job is abandoned
+        if fix_branch_name:
+            try:
+                repo.get_git_ref(f"heads/{fix_branch_name}").delete()
+                logger.info(f"🧹 Deleted branch {fix_branch_name} after cancellation")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not delete branch {fix_branch_name}: {str(e)}")
+        raise
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error processing bug: {str(e)}")
         traceback.print_exc()
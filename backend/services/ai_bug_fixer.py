@@ -1,4 +1,3 @@
-import requests
 import os
 import tempfile
 import subprocess
@@ -7,6 +6,11 @@ from typing import Dict, Any, Optional
 import logging
 
 from .function_utils import extract_primary_function_name  # new helper
+from .cancellation import CancellationToken, CancellableSession, JobCancelledError
+
+# Upper bounds per step; the job's CancellationToken may clamp them further
+API_TIMEOUT = 30
+TEST_TIMEOUT = 30
 
 logger = logging.getLogger(__name__)
 
@@ -34,29 +38,37 @@ class AIBugFixer:
         logger.info("🔍 Using enhanced local analysis (no API keys required)")
         return "local"
     
-    def analyze_and_fix_bug(self, bug_description: str, expected_fix: str, code_content: str, file_path: str = "utils.py") -> Dict[str, Any]:
+    def analyze_and_fix_bug(self, bug_description: str, expected_fix: str, code_content: str, file_path: str = "utils.py", target_function: Optional[str] = None, cancel_token: Optional[CancellationToken] = None, context: Optional[str] = None) -> Dict[str, Any]:
+        cancel_token = cancel_token or CancellationToken()
         try:
-            # Extract the main function name
-            primary_fn = extract_primary_function_name(code_content)
+            cancel_token.check()
+
+            # Prefer the function located by the symbol index, else the main function
+            primary_fn = target_function or extract_primary_function_name(code_content)
             
             # Create prompt with explicit function name requirement
-            prompt = self._create_analysis_prompt(bug_description, expected_fix, code_content, file_path, primary_fn)
+            prompt = self._create_analysis_prompt(bug_description, expected_fix, code_content, file_path, primary_fn, context)
             
             logger.info(f"🤖 Sending request to {self.ai_service} for bug analysis...")
             
             if self.ai_service == "groq":
-                ai_response = self._call_groq_api(prompt)
+                ai_response = self._call_groq_api(prompt, cancel_token)
             elif self.ai_service == "openai":
-                ai_response = self._call_openai_api(prompt)
+                ai_response = self._call_openai_api(prompt, cancel_token)
             else:
                 ai_response = self._enhanced_local_analysis(bug_description, expected_fix, code_content)
             
+            cancel_token.check()
             logger.info("✅ Received AI response")
             
             # Ensure you call _parse_ai_response correctly with self
             return self._parse_ai_response(ai_response, code_content, primary_fn)
             
+        except JobCancelledError:
+            raise
         except Exception as e:
+            # A provider timeout caused by the job deadline is a cancellation, not an AI failure
+            cancel_token.check()
             logger.error(f"❌ Error in AI analysis: {str(e)}")
             return {
                 "success": False,
@@ -66,8 +78,22 @@ class AIBugFixer:
                 "test_cases": []
             }
     
-    def _create_analysis_prompt(self, bug_description: str, expected_fix: str, code_content: str, file_path: str, primary_fn: Optional[str]) -> str:
+    def _create_analysis_prompt(self, bug_description: str, expected_fix: str, code_content: str, file_path: str, primary_fn: Optional[str], context: Optional[str] = None) -> str:
         """Create a comprehensive prompt for AI analysis"""
+        # When only one definition is sent, show the module imports and ask for that definition back
+        context_section = ""
+        scope_note = ""
+        if context is not None:
+            context_section = f"""
+**Module imports (context only, do not return them):**
+```python
+{context}
+```
+"""
+            scope_note = f"""
+The code above is only the definition of '{primary_fn}' taken from {file_path}.
+"fixed_code" must contain ONLY the corrected definition of '{primary_fn}' (with its decorators), not the rest of the file.
+"""
         return f"""
 You are analyzing a bug report for a Python function. Please provide a detailed analysis and fix.
 
@@ -77,6 +103,7 @@ You are analyzing a bug report for a Python function. Please provide a detailed
 - File: {file_path}
 - Primary function name: {primary_fn}
 
+{context_section}
 **Current Code:**
 ```python
 {code_content}
@@ -95,6 +122,7 @@ You are analyzing a bug report for a Python function. Please provide a detailed
 Do not rename or invent new functions.
 Keep the function name and signature exactly as in the provided code.
 When generating the test case, call '{primary_fn}'.
+{scope_note}
 
 
 **Response Format (JSON):**
@@ -114,7 +142,7 @@ When generating the test case, call '{primary_fn}'.
 Please respond with ONLY the JSON, no additional text.
 """
     
-    def _call_groq_api(self, prompt: str) -> str:
+    def _call_groq_api(self, prompt: str, cancel_token: Optional[CancellationToken] = None) -> str:
         """Call Groq API (free tier - 14,400 requests/day)"""
         try:
             # Get Groq API key from environment or use a public demo key
@@ -150,7 +178,10 @@ Please respond with ONLY the JSON, no additional text.
                 "temperature": 0.1
             }
             
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            # A disconnect aborts the request itself, not just the next timeout
+            cancel_token = cancel_token or CancellationToken()
+            with CancellableSession(cancel_token) as session:
+                response = session.post(url, headers=headers, json=payload, timeout=cancel_token.timeout_for(API_TIMEOUT))
             
             if response.status_code == 200:
                 result = response.json()
@@ -163,7 +194,7 @@ Please respond with ONLY the JSON, no additional text.
             logger.error(f"❌ Groq API call failed: {e}")
             raise e
     
-    def _call_huggingface_api(self, prompt: str) -> str:
+    def _call_huggingface_api(self, prompt: str, cancel_token: Optional[CancellationToken] = None) -> str:
         """Call Hugging Face Inference API (free tier)"""
         try:
             # Try multiple free models in order of preference
@@ -195,7 +226,9 @@ Please respond with ONLY the JSON, no additional text.
                         }
                     }
                     
-                    response = requests.post(model_url, headers=headers, json=payload, timeout=30)
+                    cancel_token = cancel_token or CancellationToken()
+                    with CancellableSession(cancel_token) as session:
+                        response = session.post(model_url, headers=headers, json=payload, timeout=cancel_token.timeout_for(API_TIMEOUT))
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -209,6 +242,8 @@ Please respond with ONLY the JSON, no additional text.
                         logger.warning(f"Model {model} failed with {response.status_code}, trying next...")
                         continue
                         
+                except JobCancelledError:
+                    raise
                 except Exception as model_error:
                     logger.warning(f"Model {model} failed: {model_error}, trying next...")
                     continue
@@ -220,10 +255,21 @@ Please respond with ONLY the JSON, no additional text.
             logger.error(f"❌ Hugging Face API call failed: {e}")
             raise e
     
-    def _call_openai_api(self, prompt: str) -> str:
+    def _call_openai_api(self, prompt: str, cancel_token: Optional[CancellationToken] = None) -> str:
         """Call OpenAI API (if available)"""
+        cancel_token = cancel_token or CancellationToken()
+        # Per-call client: no hidden retries past the deadline, and closing it on
+        # cancel aborts the request in flight without touching other jobs
+        from openai import OpenAI
+        client = OpenAI(
+            api_key=self.openai_client.api_key,
+            base_url=self.openai_client.base_url,
+            max_retries=0,
+            timeout=cancel_token.timeout_for(API_TIMEOUT),
+        )
+        unregister = cancel_token.on_cancel(client.close)
         try:
-            response = self.openai_client.chat.completions.create(
+            response = client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {
@@ -244,6 +290,9 @@ Please respond with ONLY the JSON, no additional text.
         except Exception as e:
             logger.error(f"❌ OpenAI API call failed: {e}")
             raise e
+        finally:
+            unregister()
+            client.close()
     
     def _enhanced_local_analysis(self, bug_description: str, expected_fix: str, code_content: str) -> str:
         """Enhanced local analysis with pattern-based bug fixing"""
@@ -348,9 +397,12 @@ Please respond with ONLY the JSON, no additional text.
                 "function_name": extracted_fn
             }
 
-    def run_tests(self, code_content: str, test_cases: list, function_name: str) -> Dict[str, Any]:
+    def run_tests(self, code_content: str, test_cases: list, function_name: str, cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
         """Run test cases against the fixed code"""
+        cancel_token = cancel_token or CancellationToken()
+        temp_file_path = test_file_path = None
         try:
+            cancel_token.check()
             with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
                 f.write(code_content)
                 temp_file_path = f.name
@@ -359,23 +411,34 @@ Please respond with ONLY the JSON, no additional text.
             with open(test_file_path, 'w', encoding='utf-8') as f:
                 f.write(self._generate_test_file(test_cases, temp_file_path, function_name))
             
-            result = subprocess.run(
-                ['python', test_file_path], 
-                capture_output=True, 
-                text=True, 
-                timeout=30
-            )
-            
-            os.unlink(temp_file_path)
-            os.unlink(test_file_path)
+            # Leaving the with block closes the pipes and waits, so a killed run is always reaped
+            with subprocess.Popen(
+                ['python', test_file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            ) as proc:
+                # Kill the sandbox as soon as the job is cancelled, not at the next check
+                unregister = cancel_token.on_cancel(proc.kill)
+                try:
+                    stdout, stderr = proc.communicate(timeout=cancel_token.timeout_for(TEST_TIMEOUT))
+                except BaseException:
+                    proc.kill()
+                    raise
+                finally:
+                    unregister()
+            cancel_token.check()
             
             return {
-                "success": result.returncode == 0,
-                "output": result.stdout,
-                "error": result.stderr,
-                "return_code": result.returncode
+                "success": proc.returncode == 0,
+                "output": stdout,
+                "error": stderr,
+                "return_code": proc.returncode
             }
+        except JobCancelledError:
+            raise
         except Exception as e:
+            cancel_token.check()
             logger.error(f"❌ Error running tests: {e}")
             return {
                 "success": False,
@@ -383,6 +446,10 @@ Please respond with ONLY the JSON, no additional text.
                 "output": "",
                 "return_code": -1
             }
+        finally:
+            for path in (temp_file_path, test_file_path):
+                if path and os.path.exists(path):
+                    os.unlink(path)
 
     def _generate_test_file(self, test_cases: list, temp_file_path: str, function_name: str) -> str:
         """Generate a deterministic test file"""
@@ -0,0 +1,160 @@
+import socket
+import threading
+import time
+import weakref
+from typing import Callable, List, Optional
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelledError(Exception):
+    """Raised inside the fix pipeline once its job has been cancelled"""
+
+
+class DeadlineExceededError(JobCancelledError):
+    """Raised inside the fix pipeline once its job has run out of time"""
+
+
+class CancellationToken:
+    """
+    Per-job deadline and cancellation flag shared by every pipeline step.
+
+    Steps call `check()` before doing irreversible work and use
+    `timeout_for()` instead of hard-coded timeouts, so no single step can
+    outlive the job. Callbacks registered with `on_cancel()` (e.g. killing a
+    test subprocess) run as soon as the job is cancelled.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self._timer: Optional[threading.Timer] = None
+        if timeout:
+            # Fire callbacks at the deadline even if no step is polling the token
+            self._timer = threading.Timer(timeout, self.cancel, args=("deadline exceeded",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        if self._timer is not None:
+            self._timer.cancel()
+        logger.info(f"🛑 Job cancelled: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"⚠️ Cancellation callback failed: {e}")
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None when there is no deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """Raise if the job has been cancelled or its deadline has passed"""
+        if self.cancelled:
+            if self.reason == "deadline exceeded":
+                raise DeadlineExceededError("Job deadline exceeded")
+            raise JobCancelledError(f"Job cancelled: {self.reason}")
+
+    def timeout_for(self, default: float) -> float:
+        """Clamp a step timeout to the time left in the job budget"""
+        self.check()
+        remaining = self.remaining()
+        return default if remaining is None else max(0.01, min(default, remaining))
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Run `callback` when the job is cancelled (immediately if it already is).
+        Returns a function that unregisters the callback.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def close(self):
+        """Stop the deadline timer once the job has finished"""
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """HTTPAdapter that can tear down connections with requests still in flight"""
+
+    def __init__(self, *args, **kwargs):
+        self._connections = weakref.WeakSet()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        connections = self._connections
+
+        def tracked(pool_cls):
+            class TrackedPool(pool_cls):
+                def _new_conn(self):
+                    conn = super()._new_conn()
+                    connections.add(conn)
+                    return conn
+            return TrackedPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: tracked(pool_cls) for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def abort(self):
+        # Session.close() only drops idle pooled connections; shutting the socket
+        # down makes a blocked read in another thread fail immediately
+        for conn in list(self._connections):
+            sock = getattr(conn, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.close()
+
+
+class CancellableSession(requests.Session):
+    """
+    requests.Session whose in-flight requests are aborted as soon as the job
+    is cancelled. Use it as a context manager so the callback is unregistered.
+    """
+
+    def __init__(self, cancel_token: CancellationToken):
+        super().__init__()
+        adapter = _AbortableAdapter()
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self._unregister = cancel_token.on_cancel(adapter.abort)
+
+    def close(self):
+        self._unregister()
+        super().close()
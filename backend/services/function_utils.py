@@ -1,5 +1,7 @@
 
+import ast
 import re
+import textwrap
 from typing import Optional
 
 def extract_primary_function_name(code_content: str) -> Optional[str]:
@@ -17,3 +19,38 @@ def extract_primary_function_name(code_content: str) -> Optional[str]:
             if not nm.startswith("_"):
                 return nm
     return name
+
+
+def module_imports(code_content: str) -> str:
+    """
+    Return the top-level import statements of a module, used as context when
+    only part of the file is sent to the model.
+    """
+    try:
+        tree = ast.parse(code_content)
+    except SyntaxError:
+        return ""
+    lines = code_content.splitlines()
+    imports = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.extend(lines[node.lineno - 1:getattr(node, "end_lineno", node.lineno)])
+    return "\n".join(imports)
+
+
+def extract_span(code_content: str, start_line: int, end_line: int) -> str:
+    """Return lines start_line..end_line (1-based, inclusive), dedented"""
+    lines = code_content.splitlines(keepends=True)
+    return textwrap.dedent("".join(lines[start_line - 1:end_line]))
+
+
+def splice_span(code_content: str, start_line: int, end_line: int, replacement: str) -> str:
+    """
+    Replace lines start_line..end_line with `replacement`, re-indented to the
+    indentation of the original first line.
+    """
+    lines = code_content.splitlines(keepends=True)
+    first = lines[start_line - 1] if start_line - 1 < len(lines) else ""
+    indent = first[:len(first) - len(first.lstrip())]
+    body = textwrap.indent(textwrap.dedent(replacement).strip("\n"), indent) + "\n"
+    return "".join(lines[:start_line - 1]) + body + "".join(lines[end_line:])
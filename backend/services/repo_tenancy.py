@@ -0,0 +1,283 @@
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Deque, Dict, List, Optional
+import logging
+
+from github import Auth, Github
+
+from .symbol_index import SymbolIndex
+from .cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+_REPO_RE = re.compile(r"^[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+$")
+_BRANCH_RE = re.compile(r"^(?!/)(?!.*\.\.)(?!.*//)[A-Za-z0-9._/-]+(?<![/.])$")
+
+
+class RepoNotAllowedError(Exception):
+    """Raised when a request targets a repository outside the allow-list"""
+
+
+class RateLimitExceededError(Exception):
+    """Raised when a repository has used up its job budget"""
+
+
+def parse_repo_list(value: Optional[str]) -> List[str]:
+    """Parse a comma/whitespace separated list of 'owner/name' repositories"""
+    return [r.strip() for r in re.split(r"[,\s]+", value or "") if r.strip()]
+
+
+def parse_repo_map(value: Optional[str]) -> Dict[str, str]:
+    """Parse 'owner/name=value' pairs, e.g. per-repository tokens or branches"""
+    mapping = {}
+    for item in parse_repo_list(value):
+        repo, sep, setting = item.partition("=")
+        if sep and repo and setting:
+            mapping[repo] = setting
+    return mapping
+
+
+def is_valid_branch_name(branch: str) -> bool:
+    """Cheap sanity check for branch names supplied by clients"""
+    return bool(branch) and len(branch) <= 255 and bool(_BRANCH_RE.match(branch))
+
+
+class RateLimitBudget:
+    """
+    Token bucket limiting how many fix jobs a single repository may start.
+    """
+
+    def __init__(self, capacity: int, per_seconds: float = 3600.0):
+        self.capacity = capacity
+        self.refill_rate = capacity / per_seconds
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, cost: float = 1.0) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+            self._updated = now
+            if self._tokens < cost:
+                return False
+            self._tokens -= cost
+            return True
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            now = time.monotonic()
+            return int(min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate))
+
+
+# Bound each GitHub call so it cannot outlive the job's deadline by much. PyGithub's
+# default (15s timeout, up to 10 retries with rate-limit backoff) can run for minutes.
+GITHUB_TIMEOUT = 10
+GITHUB_RETRIES = 1
+
+
+class RepoTenant:
+    """Per-repository GitHub client, caches and budgets"""
+
+    def __init__(
+        self,
+        full_name: str,
+        token: str,
+        jobs_per_hour: int,
+        default_branch: Optional[str] = None,
+        github_timeout: int = GITHUB_TIMEOUT,
+        github_retries: int = GITHUB_RETRIES,
+    ):
+        self.full_name = full_name
+        self.default_branch = default_branch
+        self.client = Github(auth=Auth.Token(token), timeout=github_timeout, retry=github_retries)
+        self.symbol_index = SymbolIndex()
+        self.budget = RateLimitBudget(jobs_per_hour)
+        self._repo = None
+
+    def get_repo(self):
+        """Return the PyGithub repository, resolving it once per tenant"""
+        if self._repo is None:
+            self._repo = self.client.get_repo(self.full_name)
+        return self._repo
+
+    def get_default_branch(self) -> str:
+        """Configured base branch, else the repository's own default branch on GitHub"""
+        return self.default_branch or self.get_repo().default_branch
+
+
+class FairScheduler:
+    """
+    Hands out worker slots round-robin across repositories.
+
+    Each repository has its own FIFO queue; whenever a slot frees up the next
+    repository in the rotation with waiting jobs gets it. A repository may
+    exceed `max_per_repo` slots only while no other repository is waiting, so
+    idle slots are never left unused and a hot repository cannot starve the
+    others.
+    """
+
+    def __init__(self, workers: int, max_per_repo: int):
+        self.free = workers
+        self.max_per_repo = max_per_repo
+        self._queues: Dict[str, Deque[asyncio.Future]] = {}
+        self._running: Dict[str, int] = {}
+        self._rotation: Deque[str] = deque()
+
+    async def acquire(self, key: str, cancel_token: CancellationToken):
+        """Wait for a slot for `key`, giving up as soon as the job is cancelled or expires"""
+        waiter = asyncio.get_running_loop().create_future()
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._rotation.append(key)
+        self._queues[key].append(waiter)
+        self._dispatch()
+
+        try:
+            while not waiter.done():
+                cancel_token.check()
+                remaining = cancel_token.remaining()
+                timeout = min(0.5, remaining) if remaining is not None else 0.5
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout)
+                except asyncio.TimeoutError:
+                    continue
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Granted while we were giving up: hand the slot back
+                self.release(key)
+            else:
+                waiter.cancel()
+                self._queues[key].remove(waiter)
+            raise
+
+    def release(self, key: str):
+        self.free += 1
+        self._running[key] -= 1
+        self._dispatch()
+
+    def running(self, key: str) -> int:
+        return self._running.get(key, 0)
+
+    def _dispatch(self):
+        while self.free > 0:
+            for _ in range(len(self._rotation)):
+                key = self._rotation[0]
+                self._rotation.rotate(-1)
+                queue = self._queues[key]
+                if queue and (self._running.get(key, 0) < self.max_per_repo or not self._others_waiting(key)):
+                    waiter = queue.popleft()
+                    self.free -= 1
+                    self._running[key] = self._running.get(key, 0) + 1
+                    waiter.set_result(None)
+                    break
+            else:
+                return
+
+    def _others_waiting(self, key: str) -> bool:
+        return any(queue for other, queue in self._queues.items() if other != key)
+
+
+class TenantRegistry:
+    """
+    Resolves allow-listed repositories to tenants and schedules their jobs.
+
+    All jobs share one worker pool. Jobs queue per repository and slots are
+    handed out round-robin across repositories. While other repositories are
+    waiting each is capped at `max_concurrent_jobs`, so a hot repository
+    cannot starve the others; on its own it may use the whole pool.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        allowed_repos: List[str],
+        default_repo: str,
+        repo_tokens: Optional[Dict[str, str]] = None,
+        repo_branches: Optional[Dict[str, str]] = None,
+        workers: int = 8,
+        max_concurrent_jobs: int = 1,
+        jobs_per_hour: int = 60,
+        github_timeout: int = GITHUB_TIMEOUT,
+        github_retries: int = GITHUB_RETRIES,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if not 1 <= max_concurrent_jobs <= workers:
+            raise ValueError(f"max_concurrent_jobs must be between 1 and workers ({workers}), got {max_concurrent_jobs}")
+        if workers > 1 and max_concurrent_jobs == workers:
+            logger.warning("⚠️ max_concurrent_jobs equals workers: other repositories may wait for a whole pool's worth of jobs")
+
+        self.token = token
+        self.allowed_repos = {r.lower(): r for r in allowed_repos}
+        self.default_repo = default_repo
+        self.repo_tokens = {k.lower(): v for k, v in (repo_tokens or {}).items()}
+        self.repo_branches = {k.lower(): v for k, v in (repo_branches or {}).items()}
+        self.jobs_per_hour = jobs_per_hour
+        self.github_timeout = github_timeout
+        self.github_retries = github_retries
+        self._tenants: Dict[str, RepoTenant] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="repo-worker")
+        self._scheduler = FairScheduler(workers, max_concurrent_jobs)
+
+    def resolve(self, repo_name: Optional[str]) -> RepoTenant:
+        """Return the tenant for `repo_name` (or the default repo), enforcing the allow-list"""
+        name = (repo_name or self.default_repo or "").strip()
+        if not _REPO_RE.match(name) or name.lower() not in self.allowed_repos:
+            raise RepoNotAllowedError(f"Repository '{name}' is not in the allow-list")
+
+        key = name.lower()
+        with self._lock:
+            tenant = self._tenants.get(key)
+            if tenant is None:
+                tenant = RepoTenant(
+                    self.allowed_repos[key],
+                    self.repo_tokens.get(key, self.token),
+                    self.jobs_per_hour,
+                    default_branch=self.repo_branches.get(key),
+                    github_timeout=self.github_timeout,
+                    github_retries=self.github_retries,
+                )
+                self._tenants[key] = tenant
+                logger.info(f"🏠 Created tenant for {tenant.full_name}")
+            return tenant
+
+    async def run(self, tenant: RepoTenant, fn, *args, cancel_token: Optional[CancellationToken] = None):
+        """Run a blocking job on the shared pool within the tenant's budget and concurrency cap"""
+        cancel_token = cancel_token or CancellationToken()
+        cancel_token.check()
+        # Reject early without spending; the token itself is only taken once a slot is held
+        if tenant.budget.remaining < 1:
+            raise RateLimitExceededError(f"Job budget exhausted for '{tenant.full_name}', retry later")
+
+        key = tenant.full_name.lower()
+        await self._scheduler.acquire(key, cancel_token)
+        try:
+            cancel_token.check()
+            if not tenant.budget.try_acquire():
+                raise RateLimitExceededError(f"Job budget exhausted for '{tenant.full_name}', retry later")
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, fn, *args)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Stop the worker and keep the slot until it has actually exited
+                cancel_token.cancel("request cancelled")
+                await asyncio.wait([future])
+                raise
+        finally:
+            self._scheduler.release(key)
+
+    def shutdown(self):
+        """Stop the worker pools; queued jobs are dropped, running ones finish"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            tenants = list(self._tenants.values())
+        for tenant in tenants:
+            tenant.symbol_index.shutdown()
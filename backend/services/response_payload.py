@@ -0,0 +1,125 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Duplicated views of ai_analysis that the compact schema drops
+_REDUNDANT_KEYS = ("ai_fixed_code", "ai_explanation", "ai_confidence")
+_GIT_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+def git_blob_sha(content: str) -> str:
+    """SHA git gives `content` when it is committed as a file"""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def is_git_sha(value: str) -> bool:
+    return bool(_GIT_SHA_RE.match(value or ""))
+
+
+def truncate_text(text: Optional[str], limit: int) -> Optional[str]:
+    """Cap text at `limit` characters, keeping the tail where errors usually are"""
+    if not text or limit <= 0 or len(text) <= limit:
+        return text
+    dropped = len(text) - limit
+    return f"[... {dropped} chars truncated ...]\n{text[-limit:]}"
+
+
+class FixedCodeStore:
+    """
+    Bounded content-addressed cache for generated code.
+
+    Keys are git blob SHAs, so once a fix is committed the same hash also
+    resolves on GitHub; this cache only has to survive until then and is
+    refilled from GitHub on a miss.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, code: str) -> str:
+        code_hash = git_blob_sha(code)
+        with self._lock:
+            self._items[code_hash] = code
+            self._items.move_to_end(code_hash)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return code_hash
+
+    def get(self, code_hash: str) -> Optional[str]:
+        with self._lock:
+            code = self._items.get(code_hash)
+            if code is not None:
+                self._items.move_to_end(code_hash)
+            return code
+
+
+def compact_result(
+    result: Dict[str, Any],
+    store: FixedCodeStore,
+    max_output_chars: int,
+    repo_name: Optional[str] = None,
+    keep_fixed_code: bool = False,
+) -> Dict[str, Any]:
+    """
+    Build the compact /process-bug response: fixed code by hash (inline only
+    when `keep_fixed_code`), no duplicated fields and capped test output.
+    """
+    payload = {k: v for k, v in result.items() if k not in _REDUNDANT_KEYS}
+
+    ai_analysis = payload.get("ai_analysis")
+    if isinstance(ai_analysis, dict):
+        ai_analysis = dict(ai_analysis)
+        fixed_code = ai_analysis.get("fixed_code") if keep_fixed_code else ai_analysis.pop("fixed_code", None)
+        if fixed_code:
+            code_hash = store.put(fixed_code)
+            ai_analysis["fixed_code_hash"] = code_hash
+            ai_analysis["fixed_code_size"] = len(fixed_code)
+            ai_analysis["fixed_code_url"] = f"/fixed-code/{code_hash}" + (f"?repo={repo_name}" if repo_name else "")
+        payload["ai_analysis"] = ai_analysis
+
+    test_results = payload.get("test_results")
+    if isinstance(test_results, dict):
+        test_results = dict(test_results)
+        for key in ("output", "error"):
+            test_results[key] = truncate_text(test_results.get(key), max_output_chars)
+        payload["test_results"] = test_results
+
+    return payload
+
+
+def requested_fields(fields: Optional[str]) -> List[str]:
+    return [f.strip() for f in (fields or "").split(",") if f.strip()]
+
+
+def select_fields(payload: Dict[str, Any], fields: Optional[str]) -> Dict[str, Any]:
+    """
+    Keep only the requested comma-separated fields; dotted names select nested
+    keys (e.g. "pr_url,ai_analysis.confidence"). Unknown fields are ignored.
+    """
+    if not fields:
+        return payload
+
+    selected: Dict[str, Any] = {}
+    for field in requested_fields(fields):
+        parts = field.split(".")
+        source, target = payload, selected
+        for i, part in enumerate(parts):
+            if not isinstance(source, dict) or part not in source:
+                break
+            if i == len(parts) - 1:
+                target[part] = source[part]
+            else:
+                source = source[part]
+                child = target.get(part)
+                if not isinstance(child, dict):
+                    child = target[part] = {}
+                target = child
+    return selected
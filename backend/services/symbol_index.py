@@ -0,0 +1,308 @@
+import ast
+import base64
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+import time
+from typing import Dict, Any, List, Optional
+import logging
+
+from .cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+# Blobs larger than this are almost always generated/vendored code
+MAX_BLOB_SIZE = 512 * 1024
+# Number of tree snapshots (e.g. branches / recent commits) kept in memory
+MAX_CACHED_TREES = 16
+# Cold builds fetch blobs in parallel and index at most this many files
+BLOB_FETCH_WORKERS = 8
+MAX_INDEXED_FILES = 2000
+# Cold trees are indexed in the background, at most this many at a time
+INDEX_BUILD_WORKERS = 2
+# A file only replaces the default target with a name hit or at least this score
+MIN_TARGET_SCORE = 5.0
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_CAMEL_RE = re.compile(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "be", "but", "by", "for", "from", "if", "in",
+    "is", "it", "of", "on", "or", "should", "that", "the", "this", "to", "when",
+    "with", "instead", "not", "py",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split free text or identifiers into lowercase search tokens"""
+    tokens = []
+    for word in _WORD_RE.findall(text or ""):
+        tokens.append(word.lower())
+        parts = _CAMEL_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts)
+    for ident in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text or ""):
+        if "_" in ident.strip("_"):
+            tokens.append(ident.lower())
+            tokens.extend(p.lower() for p in ident.split("_") if p)
+    return [t for t in tokens if t not in _STOPWORDS]
+
+
+def is_test_path(path: str) -> bool:
+    """Test files are never fix targets, so they are left out of the index"""
+    parts = path.lower().split("/")
+    filename = parts[-1]
+    return (
+        any(part in ("test", "tests") for part in parts[:-1])
+        or filename.startswith("test_")
+        or filename.endswith("_test.py")
+        or filename == "conftest.py"
+    )
+
+
+def extract_symbols(source: str, path: str) -> List[Dict[str, Any]]:
+    """
+    Extract function/class definitions with their line spans and docstrings.
+    """
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError) as e:
+        logger.debug(f"Skipping unparsable file {path}: {e}")
+        return []
+
+    symbols = []
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{prefix}.{child.name}" if prefix else child.name
+                # Spans include decorators so a fix can replace the whole definition
+                start_line = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                symbols.append({
+                    "name": child.name,
+                    "qualname": qualname,
+                    "kind": "class" if isinstance(child, ast.ClassDef) else "function",
+                    "path": path,
+                    "start_line": start_line,
+                    "end_line": getattr(child, "end_lineno", child.lineno),
+                    "docstring": ast.get_docstring(child) or "",
+                })
+                visit(child, qualname)
+
+    visit(tree, "")
+    return symbols
+
+
+class SymbolIndex:
+    """
+    Repository-wide index of Python functions/classes.
+
+    Each tree is listed with a single recursive tree fetch and cached by tree
+    SHA. Symbols are cached by blob SHA, so moving to a new commit only
+    downloads and parses the blobs that actually changed. Jobs use `lookup()`,
+    which builds cold trees in the background instead of on the job's budget.
+    """
+
+    def __init__(self, max_cached_trees: int = MAX_CACHED_TREES):
+        self.max_cached_trees = max_cached_trees
+        self._lock = threading.Lock()
+        # tree sha -> {"files": {path: blob_sha}, "tokens": {token: [symbol, ...]}}
+        self._trees: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # blob sha -> symbols defined in that blob
+        self._blobs: Dict[str, List[Dict[str, Any]]] = {}
+        # blob shas of trees still being built, kept safe from pruning
+        self._building: Dict[int, set] = {}
+        self._build_ids = itertools.count()
+        # tree sha -> background build
+        self._builds: Dict[str, Future] = {}
+        self._build_executor = ThreadPoolExecutor(max_workers=INDEX_BUILD_WORKERS, thread_name_prefix="index-build")
+
+    def lookup(self, repo, tree_sha: str, wait: float = 0.0, cancel_token: Optional[CancellationToken] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the index for `tree_sha`, or None if it is still being built.
+
+        A cold tree is built in the background, outside the caller's job
+        budget; the caller waits at most `wait` seconds for it and otherwise
+        falls back, while the build carries on for the next job.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        with self._lock:
+            cached = self._trees.get(tree_sha)
+            if cached is not None:
+                self._trees.move_to_end(tree_sha)
+                return cached
+            build = self._builds.get(tree_sha)
+            if build is None:
+                build = self._build_executor.submit(self.refresh, repo, tree_sha)
+                self._builds[tree_sha] = build
+                build.add_done_callback(lambda _: self._builds.pop(tree_sha, None))
+
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                return build.result(timeout=max(0.0, min(0.2, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                cancel_token.check()
+                if time.monotonic() >= deadline:
+                    return None
+
+    def shutdown(self):
+        """Drop queued background builds; running ones finish"""
+        self._build_executor.shutdown(wait=False, cancel_futures=True)
+
+    def refresh(self, repo, tree_sha: str, cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """Make sure the given tree is indexed, fetching only unseen blobs"""
+        cancel_token = cancel_token or CancellationToken()
+        with self._lock:
+            cached = self._trees.get(tree_sha)
+            if cached is not None:
+                self._trees.move_to_end(tree_sha)
+                return cached
+
+        cancel_token.check()
+        git_tree = repo.get_git_tree(tree_sha, recursive=True)
+        cancel_token.check()
+        if getattr(git_tree, "raw_data", {}).get("truncated"):
+            logger.warning(f"⚠️ Tree {tree_sha} was truncated by GitHub; index may be incomplete")
+
+        files = {}
+        for element in git_tree.tree:
+            if element.type != "blob" or not element.path.endswith(".py") or is_test_path(element.path):
+                continue
+            if element.size is not None and element.size > MAX_BLOB_SIZE:
+                continue
+            if len(files) >= MAX_INDEXED_FILES:
+                logger.warning(f"⚠️ Tree {tree_sha} has more than {MAX_INDEXED_FILES} Python files; indexing the first {MAX_INDEXED_FILES}")
+                break
+            files[element.path] = element.sha
+
+        # Hold our own references: a concurrent refresh may prune these from self._blobs
+        build_id = next(self._build_ids)
+        with self._lock:
+            self._building[build_id] = set(files.values())
+            blobs = {sha: self._blobs[sha] for sha in files.values() if sha in self._blobs}
+        missing = {}
+        for path, blob_sha in files.items():
+            if blob_sha not in blobs:
+                missing.setdefault(blob_sha, path)
+        try:
+            blobs.update(self._fetch_blobs(repo, missing, cancel_token))
+        finally:
+            with self._lock:
+                del self._building[build_id]
+
+        entry = {"files": files, "tokens": self._build_token_map(files, blobs)}
+        with self._lock:
+            self._blobs.update(blobs)
+            self._trees[tree_sha] = entry
+            self._trees.move_to_end(tree_sha)
+            while len(self._trees) > self.max_cached_trees:
+                self._trees.popitem(last=False)
+            self._prune_blobs()
+
+        logger.info(f"📚 Indexed tree {tree_sha[:7]}: {len(files)} Python files ({len(missing)} blobs fetched)")
+        return entry
+
+    def _fetch_blobs(self, repo, missing: Dict[str, str], cancel_token: CancellationToken) -> Dict[str, List[Dict[str, Any]]]:
+        """Download and parse blobs (sha -> path) a few at a time, stopping on cancellation"""
+        def fetch(item):
+            blob_sha, path = item
+            blob = repo.get_git_blob(blob_sha)
+            source = base64.b64decode(blob.content).decode("utf-8", errors="replace")
+            return blob_sha, extract_symbols(source, path)
+
+        if not missing:
+            return {}
+        fetched = {}
+        pool = ThreadPoolExecutor(max_workers=min(BLOB_FETCH_WORKERS, len(missing)), thread_name_prefix="blob-fetch")
+        try:
+            futures = [pool.submit(fetch, item) for item in missing.items()]
+            for future in as_completed(futures):
+                blob_sha, symbols = future.result()
+                fetched[blob_sha] = symbols
+                cancel_token.check()
+        finally:
+            # On cancellation, queued fetches are dropped instead of finishing in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+            # Keep what was fetched so an interrupted build is not downloaded again
+            with self._lock:
+                self._blobs.update(fetched)
+        return fetched
+
+    def _build_token_map(self, files: Dict[str, str], blobs: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        token_map: Dict[str, List[Dict[str, Any]]] = {}
+        for path, blob_sha in files.items():
+            for symbol in blobs.get(blob_sha, []):
+                # Blobs are shared between identical files, so re-attach the path
+                symbol = dict(symbol, path=path)
+                seen = set()
+                for token in _tokenize(symbol["name"]) + _tokenize(symbol["docstring"]) + _tokenize(path):
+                    if token not in seen:
+                        seen.add(token)
+                        token_map.setdefault(token, []).append(symbol)
+        return token_map
+
+    def _prune_blobs(self):
+        live = set()
+        for entry in self._trees.values():
+            live.update(entry["files"].values())
+        for blob_shas in self._building.values():
+            live.update(blob_shas)
+        for blob_sha in list(self._blobs):
+            if blob_sha not in live:
+                del self._blobs[blob_sha]
+
+    def search(self, tree_sha: str, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Rank indexed symbols by how well their name/docstring match the query.
+        `name_hit` is only set when the query names the symbol: its exact name,
+        or every part of a multi-part name (e.g. "title" and "case").
+        """
+        with self._lock:
+            entry = self._trees.get(tree_sha)
+        if entry is None:
+            return []
+
+        query_tokens = set(_tokenize(query))
+        scores: Dict[tuple, float] = {}
+        symbols: Dict[tuple, Dict[str, Any]] = {}
+        name_hits = set()
+        for token in query_tokens:
+            for symbol in entry["tokens"].get(token, []):
+                key = (symbol["path"], symbol["qualname"], symbol["start_line"])
+                symbols[key] = symbol
+                name = symbol["name"].lower()
+                name_parts = set(_tokenize(symbol["name"])) - {name}
+                if token in (name, name.replace("_", "")):
+                    score = 10.0
+                    name_hits.add(key)
+                elif token in name_parts:
+                    score = 3.0
+                    if len(name_parts) > 1 and name_parts <= query_tokens:
+                        name_hits.add(key)
+                elif token in symbol["path"].lower():
+                    score = 0.5
+                else:
+                    score = 1.0
+                scores[key] = scores.get(key, 0.0) + score
+
+        ranked = sorted(scores, key=lambda k: (-scores[k], k))
+        return [dict(symbols[k], score=scores[k], name_hit=k in name_hits) for k in ranked[:limit]]
+
+    def find_target_files(self, tree_sha: str, query: str, limit: int = 3, min_score: float = MIN_TARGET_SCORE) -> List[Dict[str, Any]]:
+        """
+        Return the files most likely to contain the bug, best match first.
+        A file scores as its best symbol, so many weak matches do not add up;
+        files without a name hit and below `min_score` are dropped so callers
+        keep their fallback.
+        """
+        files: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        for symbol in self.search(tree_sha, query, limit=limit * 5):
+            match = files.setdefault(symbol["path"], {"path": symbol["path"], "score": 0.0, "name_hit": False, "symbols": []})
+            match["score"] = max(match["score"], symbol["score"])
+            match["name_hit"] = match["name_hit"] or symbol["name_hit"]
+            match["symbols"].append(symbol)
+        confident = [m for m in files.values() if m["name_hit"] or m["score"] >= min_score]
+        ranked = sorted(confident, key=lambda m: (not m["name_hit"], -m["score"]))
+        return ranked[:limit]
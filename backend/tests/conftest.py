@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Tests import the backend the same way uvicorn does: from the backend/ directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main.py refuses to start without credentials; the tests never reach GitHub or OpenAI
+os.environ.setdefault("GITHUB_TOKEN", "test-token")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("GITHUB_REPO", "octo/repo")
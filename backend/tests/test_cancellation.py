@@ -0,0 +1,186 @@
+import asyncio
+import http.server
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from services.ai_bug_fixer import AIBugFixer
+from services.cancellation import CancellableSession, CancellationToken, DeadlineExceededError, JobCancelledError
+from services.repo_tenancy import TenantRegistry
+from services.symbol_index import SymbolIndex
+
+
+@pytest.fixture
+def slow_server():
+    class SlowHandler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            time.sleep(3)
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+def test_cancel_aborts_request_in_flight(slow_server):
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel, args=("client disconnected",)).start()
+    started = time.monotonic()
+    with CancellableSession(token) as session:
+        with pytest.raises(requests.ConnectionError):
+            session.post(slow_server, json={}, timeout=10)
+    assert time.monotonic() - started < 2
+    with pytest.raises(JobCancelledError):
+        token.check()
+
+
+def test_deadline_fires_callbacks():
+    fired = threading.Event()
+    token = CancellationToken(0.1)
+    token.on_cancel(fired.set)
+    assert fired.wait(2)
+    with pytest.raises(DeadlineExceededError):
+        token.check()
+
+
+def test_on_cancel_runs_immediately_when_already_cancelled():
+    token = CancellationToken()
+    token.cancel()
+    calls = []
+    token.on_cancel(lambda: calls.append(True))
+    assert calls == [True]
+
+
+def test_run_tests_kills_subprocess_on_cancel():
+    token = CancellationToken()
+    threading.Timer(0.3, token.cancel, args=("client disconnected",)).start()
+    started = time.monotonic()
+    with pytest.raises(JobCancelledError):
+        AIBugFixer().run_tests("import time\ntime.sleep(20)\n", [], "add", token)
+    assert time.monotonic() - started < 5
+
+
+class _FakeFixer:
+    def analyze_and_fix_bug(self, *args, **kwargs):
+        return {
+            "success": True,
+            "analysis": "subtraction instead of addition",
+            "fixed_code": "def add(a, b):\n    return a + b\n",
+            "explanation": "use +",
+            "test_cases": [],
+            "function_name": "add",
+            "confidence": "high",
+        }
+
+    def run_tests(self, *args, **kwargs):
+        return {"success": True, "output": "ok", "error": "", "return_code": 0}
+
+
+class _FakeRepo:
+    full_name = "octo/repo"
+
+    def __init__(self, cancel_token):
+        self.cancel_token = cancel_token
+        self.refs = set()
+        self.deleted = []
+        self.pulls = []
+
+    def get_branch(self, name):
+        commit = SimpleNamespace(sha="c1", commit=SimpleNamespace(tree=SimpleNamespace(sha="t1")))
+        return SimpleNamespace(name=name, commit=commit)
+
+    def get_git_tree(self, sha, recursive=False):
+        return SimpleNamespace(tree=[], raw_data={})
+
+    def get_contents(self, path, ref=None):
+        return SimpleNamespace(path=path, sha="s1", decoded_content=b"def add(a, b):\n    return a - b\n")
+
+    def create_git_ref(self, ref, sha):
+        self.refs.add(ref)
+
+    def update_file(self, *args, **kwargs):
+        # The client goes away right after the fix is committed
+        self.cancel_token.cancel("client disconnected")
+
+    def create_pull(self, **kwargs):
+        self.pulls.append(kwargs)
+
+    def get_git_ref(self, ref):
+        return SimpleNamespace(delete=lambda: self.deleted.append(ref))
+
+
+def test_fix_branch_is_deleted_after_cancellation(monkeypatch):
+    import main
+
+    token = CancellationToken()
+    repo = _FakeRepo(token)
+    tenant = SimpleNamespace(full_name="octo/repo", get_repo=lambda: repo, symbol_index=SymbolIndex())
+    monkeypatch.setattr(main, "ai_fixer", _FakeFixer())
+
+    with pytest.raises(JobCancelledError):
+        main._run_fix_pipeline(tenant, "main", "add(5, 3) returns 2", "should return 8", None, None, token)
+
+    assert repo.pulls == []
+    (ref,) = repo.refs
+    assert repo.deleted == [ref[len("refs/"):]]
+
+
+def test_slot_is_released_after_request_task_is_cancelled():
+    async def scenario():
+        registry = TenantRegistry("token", ["octo/repo"], default_repo="octo/repo", workers=1)
+        tenant = registry.resolve("octo/repo")
+        token = CancellationToken()
+        worker_stopped = threading.Event()
+        cancelled = threading.Event()
+        token.on_cancel(cancelled.set)
+
+        def job():
+            # Blocks like a long LLM call until the job is cancelled
+            cancelled.wait(5)
+            time.sleep(0.1)
+            worker_stopped.set()
+
+        task = asyncio.create_task(registry.run(tenant, job, cancel_token=token))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # The slot was held until the worker actually exited, then released
+        assert token.cancelled and worker_stopped.is_set()
+        assert registry._scheduler.running("octo/repo") == 0
+        result = await asyncio.wait_for(registry.run(tenant, lambda: "next"), timeout=2)
+        registry.shutdown()
+        return result
+
+    assert asyncio.run(scenario()) == "next"
+
+
+def test_run_tests_reaps_killed_subprocess(monkeypatch):
+    import subprocess
+
+    procs = []
+    original = subprocess.Popen
+
+    def popen_then_cancel(*args, **kwargs):
+        procs.append(original(*args, **kwargs))
+        # The client goes away right after the sandbox starts
+        token.cancel("client disconnected")
+        return procs[-1]
+
+    token = CancellationToken()
+    monkeypatch.setattr(subprocess, "Popen", popen_then_cancel)
+    with pytest.raises(JobCancelledError):
+        AIBugFixer().run_tests("import time\ntime.sleep(20)\n", [], "add", token)
+    # The killed sandbox has been waited for, so no zombie is left behind
+    (proc,) = procs
+    assert proc.returncode is not None
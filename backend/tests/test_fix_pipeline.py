@@ -0,0 +1,54 @@
+import main
+from services.symbol_index import extract_symbols
+
+SOURCE = """class A:
+    def run(self):
+        return 1
+
+
+class B:
+    def run(self):
+        return 2
+"""
+
+
+def test_target_span_is_looked_up_by_qualname():
+    b_run = next(s for s in extract_symbols(SOURCE, "jobs.py") if s["qualname"] == "B.run")
+
+    span = main._find_target_span(SOURCE, "jobs.py", b_run)
+    assert span["qualname"] == "B.run"
+    assert span["start_line"] == 7
+
+
+def test_target_span_falls_back_to_nearest_name_match():
+    moved = {"name": "run", "qualname": "C.run", "start_line": 8}
+
+    assert main._find_target_span(SOURCE, "jobs.py", moved)["qualname"] == "B.run"
+    assert main._find_target_span(SOURCE, "jobs.py")["qualname"] == "A.run"
+
+
+def _b_run():
+    return main._find_target_span(SOURCE, "jobs.py", {"name": "run", "qualname": "B.run", "start_line": 7})
+
+
+def test_reply_with_single_definition_is_accepted():
+    definition, error = main._target_definition_from_reply("def run(self):\n    return 3\n", "jobs.py", _b_run())
+    assert error is None
+    assert definition == "def run(self):\n    return 3\n"
+
+
+def test_whole_file_reply_only_contributes_the_target():
+    reply = SOURCE.replace("return 2", "return 3")
+    definition, error = main._target_definition_from_reply(reply, "jobs.py", _b_run())
+    assert error is None
+    assert definition == "def run(self):\n    return 3\n"
+
+    spliced = main.splice_span(SOURCE, 7, 8, definition)
+    assert spliced.count("class B") == 1
+    assert "return 3" in spliced and "return 1" in spliced
+
+
+def test_reply_without_target_is_rejected():
+    for reply in ("def other():\n    return 3\n", "def run(:\n", "def run():\n    pass\n\ndef run():\n    pass\n"):
+        definition, error = main._target_definition_from_reply(reply, "jobs.py", _b_run())
+        assert definition is None and error
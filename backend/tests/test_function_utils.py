@@ -0,0 +1,39 @@
+from services.function_utils import extract_span, module_imports, splice_span
+from services.symbol_index import extract_symbols
+
+SOURCE = """import os
+from typing import List
+
+
+class Calculator:
+    @staticmethod
+    def add(a, b):
+        return a - b
+
+    def total(self, values: List[int]):
+        return sum(values)
+"""
+
+
+def _span(name):
+    sym = next(s for s in extract_symbols(SOURCE, "calc.py") if s["name"] == name)
+    return sym["start_line"], sym["end_line"]
+
+
+def test_span_includes_decorators_and_is_dedented():
+    start, end = _span("add")
+    assert extract_span(SOURCE, start, end) == "@staticmethod\ndef add(a, b):\n    return a - b\n"
+
+
+def test_splice_reindents_and_keeps_rest_of_file():
+    start, end = _span("add")
+    fixed = "@staticmethod\ndef add(a, b):\n    return a + b\n"
+    result = splice_span(SOURCE, start, end, fixed)
+    assert "        return a + b\n" in result
+    assert "return a - b" not in result
+    assert result.endswith("        return sum(values)\n")
+    compile(result, "calc.py", "exec")
+
+
+def test_module_imports():
+    assert module_imports(SOURCE) == "import os\nfrom typing import List"
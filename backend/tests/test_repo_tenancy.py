@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from services.cancellation import CancellationToken, JobCancelledError
+from services.repo_tenancy import (
+    FairScheduler,
+    RateLimitBudget,
+    RepoNotAllowedError,
+    TenantRegistry,
+    is_valid_branch_name,
+)
+
+
+def _registry(**kwargs):
+    return TenantRegistry("token", ["octo/hot", "octo/cold"], default_repo="octo/hot", **kwargs)
+
+
+def test_allow_list_and_branch_validation():
+    registry = _registry()
+    assert registry.resolve(None).full_name == "octo/hot"
+    assert registry.resolve("OCTO/cold") is registry.resolve("octo/cold")
+    with pytest.raises(RepoNotAllowedError):
+        registry.resolve("octo/other")
+    assert is_valid_branch_name("feature/fix-1")
+    assert not is_valid_branch_name("../main")
+
+
+def test_default_branch_is_per_repo():
+    registry = _registry(repo_branches={"OCTO/hot": "develop"})
+    hot, cold = registry.resolve("octo/hot"), registry.resolve("octo/cold")
+    cold._repo = SimpleNamespace(default_branch="trunk")
+
+    assert hot.get_default_branch() == "develop"
+    # Without an override the repository's own default branch is used
+    assert cold.get_default_branch() == "trunk"
+
+
+def test_github_calls_are_bounded():
+    tenant = _registry(github_timeout=5, github_retries=0).resolve("octo/hot")
+    settings = tenant.client.requester.kwargs
+    # No long PyGithub retry/backoff loop can outlive the job deadline
+    assert settings["timeout"] == 5 and settings["retry"] == 0
+
+
+def test_rejects_concurrency_cap_above_pool_size():
+    with pytest.raises(ValueError):
+        _registry(workers=2, max_concurrent_jobs=3)
+
+
+def test_budget_token_bucket():
+    budget = RateLimitBudget(2)
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+
+
+def test_scheduler_serves_repos_round_robin():
+    async def scenario():
+        scheduler = FairScheduler(workers=1, max_per_repo=1)
+        token = CancellationToken()
+        order = []
+        await scheduler.acquire("hot", token)
+
+        async def job(key):
+            await scheduler.acquire(key, token)
+            order.append(key)
+            scheduler.release(key)
+
+        tasks = [asyncio.create_task(job(k)) for k in ("hot", "hot", "cold")]
+        await asyncio.sleep(0)
+        scheduler.release("hot")
+        await asyncio.gather(*tasks)
+        return order
+
+    # The cold repo is served before the hot repo's second queued job
+    assert asyncio.run(scenario()) == ["hot", "cold", "hot"]
+
+
+def test_job_cancelled_while_queued_does_not_spend_budget():
+    async def scenario():
+        registry = _registry(workers=1, jobs_per_hour=5)
+        tenant = registry.resolve("octo/hot")
+        release = threading.Event()
+        first = asyncio.create_task(registry.run(tenant, release.wait))
+        await asyncio.sleep(0.05)
+
+        token = CancellationToken()
+        queued = asyncio.create_task(registry.run(tenant, lambda: None, cancel_token=token))
+        await asyncio.sleep(0.05)
+        token.cancel("client disconnected")
+        with pytest.raises(JobCancelledError):
+            await queued
+
+        release.set()
+        await first
+        registry.shutdown()
+        return tenant.budget.remaining
+
+    assert asyncio.run(scenario()) == 4
+
+
+def test_scheduler_lends_idle_slots_beyond_the_cap():
+    async def scenario():
+        scheduler = FairScheduler(workers=2, max_per_repo=1)
+        token = CancellationToken()
+        # Alone, a repository may use every slot
+        await scheduler.acquire("hot", token)
+        await scheduler.acquire("hot", token)
+        assert scheduler.running("hot") == 2
+
+        queued_hot = asyncio.create_task(scheduler.acquire("hot", token))
+        queued_cold = asyncio.create_task(scheduler.acquire("cold", token))
+        await asyncio.sleep(0)
+        # Once another repository is waiting, the over-cap repository yields the next slot
+        scheduler.release("hot")
+        await asyncio.wait_for(queued_cold, 1)
+        assert not queued_hot.done()
+
+        scheduler.release("cold")
+        await asyncio.wait_for(queued_hot, 1)
+        return scheduler.running("hot")
+
+    assert asyncio.run(scenario()) == 2
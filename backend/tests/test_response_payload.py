@@ -0,0 +1,64 @@
+import base64
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from services.response_payload import FixedCodeStore, compact_result, git_blob_sha, select_fields, truncate_text
+
+RESULT = {
+    "message": "done",
+    "pr_url": "https://github.com/octo/repo/pull/1",
+    "ai_fixed_code": "def add(a, b):\n    return a + b\n",
+    "ai_analysis": {
+        "analysis": "subtraction instead of addition",
+        "confidence": "high",
+        "fixed_code": "def add(a, b):\n    return a + b\n",
+    },
+    "test_results": {"success": True, "output": "x" * 50, "error": ""},
+}
+
+
+def test_compact_result_references_code_by_git_blob_sha():
+    store = FixedCodeStore()
+    payload = compact_result(RESULT, store, 20, repo_name="octo/repo")
+
+    code = RESULT["ai_analysis"]["fixed_code"]
+    analysis = payload["ai_analysis"]
+    assert "ai_fixed_code" not in payload
+    assert "fixed_code" not in analysis
+    assert analysis["fixed_code_hash"] == git_blob_sha(code)
+    assert analysis["fixed_code_url"] == f"/fixed-code/{git_blob_sha(code)}?repo=octo/repo"
+    assert store.get(analysis["fixed_code_hash"]) == code
+    assert payload["test_results"]["output"].endswith("x" * 20)
+
+
+def test_compact_result_can_keep_code_inline():
+    payload = compact_result(RESULT, FixedCodeStore(), 20, keep_fixed_code=True)
+    assert payload["ai_analysis"]["fixed_code"] == RESULT["ai_analysis"]["fixed_code"]
+
+
+def test_select_fields_and_truncate_text():
+    assert select_fields(RESULT, "pr_url,ai_analysis.confidence,missing.key") == {
+        "pr_url": RESULT["pr_url"],
+        "ai_analysis": {"confidence": "high"},
+    }
+    assert truncate_text("short", 10) == "short"
+    assert truncate_text("abcdef", 2) == "[... 4 chars truncated ...]\nef"
+
+
+def test_fixed_code_endpoint_falls_back_to_committed_blob(monkeypatch):
+    import main
+
+    code = "def add(a, b):\n    return a + b\n"
+    code_hash = git_blob_sha(code)
+    fake_repo = SimpleNamespace(
+        get_git_blob=lambda sha: SimpleNamespace(content=base64.b64encode(code.encode("utf-8")).decode("ascii"))
+    )
+    monkeypatch.setattr(main, "fixed_code_store", FixedCodeStore())
+    monkeypatch.setattr(main.tenants, "resolve", lambda repo: SimpleNamespace(full_name="octo/repo", get_repo=lambda: fake_repo))
+
+    client = TestClient(main.app)
+    response = client.get(f"/fixed-code/{code_hash}?repo=octo/repo")
+    assert response.status_code == 200
+    assert response.text == code
+    assert client.get("/fixed-code/not-a-sha").status_code == 400
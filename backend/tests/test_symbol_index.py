@@ -0,0 +1,175 @@
+import base64
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from services.cancellation import CancellationToken, JobCancelledError
+from services.symbol_index import SymbolIndex, is_test_path
+
+
+class FakeRepo:
+    """Just enough of a PyGithub repository for the index"""
+
+    def __init__(self, files):
+        self.files = files
+        self.blob_fetches = []
+
+    @staticmethod
+    def blob_sha(content):
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def get_git_tree(self, sha, recursive=False):
+        tree = [
+            SimpleNamespace(path=path, type="blob", sha=self.blob_sha(content), size=len(content))
+            for path, content in self.files.items()
+        ]
+        return SimpleNamespace(tree=tree, raw_data={"truncated": False})
+
+    def get_git_blob(self, sha):
+        self.blob_fetches.append(sha)
+        content = next(c for c in self.files.values() if self.blob_sha(c) == sha)
+        return SimpleNamespace(content=base64.b64encode(content.encode("utf-8")).decode("ascii"))
+
+
+FILES = {
+    "utils.py": "def add_numbers(a, b):\n    '''Add two numbers'''\n    return a - b\n",
+    "pkg/strings.py": "class Formatter:\n    def title_case(self, s):\n        '''Capitalize words'''\n        return s\n",
+    "tests/test_utils.py": "def test_fails():\n    '''The test fails'''\n    assert False\n",
+}
+
+
+def test_name_hit_selects_file():
+    repo = FakeRepo(dict(FILES))
+    index = SymbolIndex()
+    index.refresh(repo, "t1")
+
+    matches = index.find_target_files("t1", "titleCase returns lowercase words")
+    assert matches[0]["path"] == "pkg/strings.py"
+    assert matches[0]["symbols"][0]["name"] == "title_case"
+
+
+def test_test_files_and_weak_matches_are_ignored():
+    repo = FakeRepo(dict(FILES))
+    index = SymbolIndex()
+    index.refresh(repo, "t1")
+
+    # Only a docstring word matches: not enough to leave the fallback
+    assert index.find_target_files("t1", "The test fails") == []
+    assert all("tests/" not in m["path"] for m in index.find_target_files("t1", "test_fails add_numbers"))
+
+
+def test_refresh_only_fetches_changed_blobs():
+    files = dict(FILES)
+    repo = FakeRepo(files)
+    index = SymbolIndex()
+    index.refresh(repo, "t1")
+    assert len(repo.blob_fetches) == 2
+
+    files["utils.py"] += "\n"
+    index.refresh(repo, "t2")
+    assert len(repo.blob_fetches) == 3
+    index.refresh(repo, "t1")
+    assert len(repo.blob_fetches) == 3
+
+
+def test_is_test_path():
+    assert is_test_path("tests/test_utils.py")
+    assert is_test_path("pkg/test_strings.py")
+    assert is_test_path("pkg/strings_test.py")
+    assert not is_test_path("pkg/testing_utils.py")
+
+
+def test_concurrent_prune_does_not_drop_fetched_blobs():
+    repo = FakeRepo(dict(FILES))
+    index = SymbolIndex(max_cached_trees=1)
+    original_fetch = index._fetch_blobs
+
+    def fetch_then_prune(repo_, missing, cancel_token):
+        fetched = original_fetch(repo_, missing, cancel_token)
+        # Another thread finishes a refresh (and prunes) while this one is still building
+        with index._lock:
+            index._blobs.clear()
+            index._prune_blobs()
+        return fetched
+
+    index._fetch_blobs = fetch_then_prune
+    index.refresh(repo, "t1")
+    assert index.find_target_files("t1", "add_numbers")[0]["path"] == "utils.py"
+
+
+def test_refresh_stops_when_job_is_cancelled():
+    repo = FakeRepo(dict(FILES))
+    token = CancellationToken()
+    original = repo.get_git_blob
+
+    def fetch_and_cancel(sha):
+        token.cancel("client disconnected")
+        return original(sha)
+
+    repo.get_git_blob = fetch_and_cancel
+    index = SymbolIndex()
+    with pytest.raises(JobCancelledError):
+        index.refresh(repo, "t1", token)
+    # Nothing half-built is cached for the tree
+    assert index.search("t1", "add_numbers") == []
+
+
+def test_cancelled_refresh_keeps_fetched_blobs():
+    repo = FakeRepo(dict(FILES))
+    token = CancellationToken()
+    original = repo.get_git_blob
+
+    def fetch_and_cancel(sha):
+        token.cancel("deadline exceeded")
+        return original(sha)
+
+    repo.get_git_blob = fetch_and_cancel
+    index = SymbolIndex()
+    with pytest.raises(JobCancelledError):
+        index.refresh(repo, "t1", token)
+    fetched = len(repo.blob_fetches)
+    assert fetched >= 1
+
+    repo.get_git_blob = original
+    index.refresh(repo, "t1")
+    # Only the blobs the cancelled build did not get to are fetched again
+    assert len(repo.blob_fetches) == 2
+
+
+def test_lookup_builds_cold_tree_in_background():
+    repo = FakeRepo(dict(FILES))
+    release = threading.Event()
+    original = repo.get_git_blob
+
+    def slow_fetch(sha):
+        release.wait(5)
+        return original(sha)
+
+    repo.get_git_blob = slow_fetch
+    index = SymbolIndex()
+    # The job does not wait for the cold build and falls back instead
+    assert index.lookup(repo, "t1", wait=0.05) is None
+
+    release.set()
+    entry = index.lookup(repo, "t1", wait=5)
+    assert entry is not None
+    assert index.find_target_files("t1", "add_numbers")[0]["path"] == "utils.py"
+    assert len(repo.blob_fetches) == 2
+
+
+def test_partial_name_matches_do_not_add_up():
+    files = dict(FILES)
+    files["app/config.py"] = (
+        "def get_value(key):\n    '''Return the value stored for key'''\n\n\n"
+        "def set_value(key, value):\n    '''Store the value for key'''\n\n\n"
+        "def sum_values(values):\n    '''Sum the stored values'''\n"
+    )
+    index = SymbolIndex()
+    index.refresh(FakeRepo(files), "t1")
+
+    # One shared word per symbol is neither a name hit nor enough score
+    assert index.find_target_files("t1", "The sum returns the wrong value") == []
+    # Every part of a multi-part name counts as naming it
+    assert index.find_target_files("t1", "get value returns None")[0]["name_hit"]